@@ -1,20 +1,61 @@
 # config.py
-import os
-from dotenv import load_dotenv
+from functools import lru_cache
+from typing import Literal, Optional
+from pydantic import field_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
-# Load variables from .env
-load_dotenv()
 
-# Mongo Configuration
-MONGO_URL = os.getenv("MONGO_URL")
-DB_NAME = os.getenv("DB_NAME")
+class Settings(BaseSettings):
+    # Values come from the environment, falling back to .env
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
-# JWT configuration
-SECRET_KEY = os.getenv("SECRET_KEY")
-ALGORITHM = os.getenv("ALGORITHM")
+    # Mongo Configuration
+    MONGO_URL: str
+    DB_NAME: str
+    MONGO_MAX_POOL_SIZE: int = 50
+    MONGO_MIN_POOL_SIZE: int = 10
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = 2000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 3000
 
-# Email Configuration
-EMAIL_HOST = os.getenv("EMAIL_HOST")
-EMAIL_PORT = int(os.getenv("EMAIL_PORT", 587))  
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASS = os.getenv("EMAIL_PASS")
+    # JWT configuration
+    SECRET_KEY: str
+    ALGORITHM: str
+
+    # Email Configuration
+    EMAIL_HOST: Optional[str] = None
+    EMAIL_PORT: int = 587
+    EMAIL_USER: Optional[str] = None
+    EMAIL_PASS: Optional[str] = None
+
+    # Logging
+    LOG_LEVEL: Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"] = "INFO"
+
+    @field_validator("LOG_LEVEL", mode="before")
+    @classmethod
+    def _upper_log_level(cls, value):
+        # Accept LOG_LEVEL=info as well as INFO
+        return value.upper() if isinstance(value, str) else value
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Parse and validate the configuration once per process."""
+    return Settings()
+
+
+settings = get_settings()
+
+# Module-level names kept for existing imports
+MONGO_URL = settings.MONGO_URL
+DB_NAME = settings.DB_NAME
+MONGO_MAX_POOL_SIZE = settings.MONGO_MAX_POOL_SIZE
+MONGO_MIN_POOL_SIZE = settings.MONGO_MIN_POOL_SIZE
+MONGO_WAIT_QUEUE_TIMEOUT_MS = settings.MONGO_WAIT_QUEUE_TIMEOUT_MS
+MONGO_SERVER_SELECTION_TIMEOUT_MS = settings.MONGO_SERVER_SELECTION_TIMEOUT_MS
+SECRET_KEY = settings.SECRET_KEY
+ALGORITHM = settings.ALGORITHM
+EMAIL_HOST = settings.EMAIL_HOST
+EMAIL_PORT = settings.EMAIL_PORT
+EMAIL_USER = settings.EMAIL_USER
+EMAIL_PASS = settings.EMAIL_PASS
+LOG_LEVEL = settings.LOG_LEVEL
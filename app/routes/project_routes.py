@@ -1,42 +1,84 @@
-from fastapi import APIRouter, Depends
+import asyncio
+import hashlib
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 from app.schemas.project_schema import ProjectCreate, ProjectUpdate, ProjectResponse
-from app.services.project_service import create_project, update_project, get_project, list_projects, delete_project
-from app.utils.auth_utils import get_current_user
+from app.schemas.common_schema import PyObjectId
+from app.schemas.task_schema import TaskOut
+from app.services.project_service import create_project, update_project, get_project, list_projects, delete_project, project_exists
+from app.services.task_service import get_all_tasks, TASK_PAGE_SIZE
+from app.utils.auth_utils import get_current_user, require_roles
+from app.utils.common_utils import task_list_response
 
 router = APIRouter()
 
-# RB check helper
-def check_role(user, allowed_roles=["admin", "manager"]):
-    return user["role"] in allowed_roles
+# Services return plain JSON-ready dicts (ids stringified, tasks serialized), so every
+# route renders them with ORJSONResponse directly instead of jsonable_encoder + json.dumps
 
 # Create project
-@router.post("/", response_model=dict)
-async def creates_project(project: ProjectCreate, user=Depends(get_current_user)):
-    if not check_role(user):
-        return {"success": False, "message": "Not authorized"}
+@router.post("/")
+async def creates_project(project: ProjectCreate, user=Depends(require_roles("admin", "manager"))):
     result = await create_project(user["user_id"], project.model_dump())
-    return result
+    return ORJSONResponse(result)
 
 # Update project
-@router.put("/{project_id}", response_model=dict)
-async def updates_project(project_id: str, project: ProjectUpdate, user=Depends(get_current_user)):
-    if not check_role(user):
-        return {"success": False, "message": "Not authorized"}
-    return await update_project(project_id, project.model_dump(exclude_unset=True))
+@router.put("/{project_id}")
+async def updates_project(project_id: PyObjectId, project: ProjectUpdate, user=Depends(require_roles("admin", "manager"))):
+    # Only the fields the client actually sent, read straight off the model
+    update_fields = {name: getattr(project, name) for name in project.model_fields_set}
+    return ORJSONResponse(await update_project(project_id, update_fields))
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    # If-None-Match is "*" or a comma-separated list of entity tags; GET uses weak
+    # comparison (RFC 9110), so a W/ prefix is ignored on either side
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag.removeprefix("W/")
+        for tag in if_none_match.split(",")
+    )
 
 # Get single project
-@router.get("/{project_id}", response_model=dict)
-async def gets_project(project_id: str, user=Depends(get_current_user)):
-    return await get_project(project_id)
+@router.get("/{project_id}")
+async def gets_project(project_id: PyObjectId, request: Request, user=Depends(get_current_user)):
+    result = await get_project(project_id)
+    if not result["success"]:
+        return ORJSONResponse(result)
+
+    # ETag over the rendered body, so it changes with the project and its tasks
+    response = ORJSONResponse(result)
+    etag = f'"{hashlib.sha1(response.body).hexdigest()}"'
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return response
 
-# List all projects
-@router.get("/", response_model=dict)
+# List all projects (summaries with task_count, no tasks)
+@router.get("/")
 async def lists_projects(user=Depends(get_current_user)):
-    return await list_projects()
+    return ORJSONResponse(await list_projects(user))
+
+# Tasks of a project, paged newest-first like GET /tasks/ (developers/testers see only their own)
+@router.get("/{project_id}/tasks", responses={200: {"model": List[TaskOut]}})
+async def lists_project_tasks(
+    project_id: PyObjectId,
+    after: Optional[PyObjectId] = Query(None, description="Last task id of the previous page"),
+    limit: int = Query(TASK_PAGE_SIZE, ge=1, le=500),
+    user=Depends(get_current_user),
+):
+    # Independent reads, so the existence check overlaps the task page
+    exists, tasks = await asyncio.gather(
+        project_exists(project_id),
+        get_all_tasks({"project_id": project_id}, user, after, limit),
+    )
+    if not exists:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return task_list_response(tasks)
 
 # Delete project
-@router.delete("/{project_id}", response_model=dict)
-async def deletes_project(project_id: str, user=Depends(get_current_user)):
-    if not check_role(user):
-        return {"success": False, "message": "Not authorized"}
-    return await delete_project(project_id)
+@router.delete("/{project_id}")
+async def deletes_project(project_id: PyObjectId, user=Depends(require_roles("admin", "manager"))):
+    return ORJSONResponse(await delete_project(project_id))
@@ -1,10 +1,12 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from pydantic import EmailStr
 from urllib.request import Request
 from app.utils.db_utils import login_attempts_collection
 from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import ORJSONResponse
 from app.schemas.user_schema import LoginRequest, LoginResponse, PasswordChangeRequest, PasswordResetRequest, RegisterUser, RegisterResponse
 from app.services.user_service import change_password, login_user, register_user, request_password_reset
+from app.utils.auth_utils import evict_cached_token
 from fastapi.security import HTTPBearer
 from fastapi import Depends
 
@@ -21,10 +23,11 @@ async def register(user: RegisterUser):
     
     return RegisterResponse(email=user.email)
 
-@router.post("/login", response_model=LoginResponse)
+@router.post("/login", responses={200: {"model": LoginResponse}})
 async def login(payload: LoginRequest):
     result = await login_user(payload.email, payload.password)
-    return LoginResponse(**result)
+    # Built by our own service in the LoginResponse shape; render it without re-validating
+    return ORJSONResponse({"success": result["success"], "message": result["message"], "data": result.get("data")})
 
 @router.post("/request-password-reset")
 async def request_password_reset_endpoint(payload: PasswordResetRequest):
@@ -40,15 +43,14 @@ async def change_password_endpoint(payload: PasswordChangeRequest):
 async def logout(credentials: HTTPBearer = Depends(auth_scheme)):
     token = credentials.credentials
 
-    # Find the active login attempt for this token
-    attempt = await login_attempts_collection.find_one({"token": token, "expired": False})
+    # Find the active login attempt for this token and mark it expired in one round trip
+    attempt = await login_attempts_collection.find_one_and_update(
+        {"token": token, "expired": False},
+        {"$set": {"expired": True, "logout_time": datetime.now(timezone.utc)}},
+        projection={"_id": 1}
+    )
     if not attempt:
         raise HTTPException(status_code=401, detail="Token already expired or invalid")
-
-    # Mark the token as expired and set logout time
-    await login_attempts_collection.update_one(
-        {"_id": attempt["_id"]},
-        {"$set": {"expired": True, "logout_time": datetime.utcnow()}}
-    )
+    evict_cached_token(token)
 
     return {"message": "Successfully logged out"}
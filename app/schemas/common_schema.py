@@ -0,0 +1,13 @@
+import re
+from typing import Annotated
+from pydantic import AfterValidator
+
+OBJECT_ID_RE = re.compile(r"^[0-9a-fA-F]{24}\Z")
+
+def _check_object_id(value: str) -> str:
+    if not OBJECT_ID_RE.match(value):
+        raise ValueError("Invalid id")
+    return value
+
+# 24-hex ObjectId string, rejected with 422 at the request boundary before any DB call
+PyObjectId = Annotated[str, AfterValidator(_check_object_id)]
@@ -11,9 +11,9 @@ class ProjectCreate(ProjectBase):
     pass
 
 class ProjectUpdate(BaseModel):
-    name: Optional[str]
-    description: Optional[str]
-    status: Optional[Literal["active","completed","on_hold"]]
+    name: Optional[str] = None
+    description: Optional[str] = None
+    status: Optional[Literal["active","completed","on_hold"]] = None
 
 class ProjectResponse(ProjectBase):
     id: str
@@ -1,6 +1,6 @@
 from typing import Optional, List
 from datetime import datetime
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
 from enum import Enum
 
 class Role(str, Enum):
@@ -78,18 +78,15 @@ class TaskFilter(BaseModel):
 
 # -------- DB Model -> Response --------
 class TaskOut(TaskBase):
+    # Emails were validated on the way in (TaskCreate/TaskUpdateAdmin), plain str on the way out
+    model_config = ConfigDict(populate_by_name=True, frozen=True)
+
     id: str = Field(alias="id")  # expose stringified ObjectId
-    assigned_to_dev: Optional[EmailStr] = None
-    assigned_to_tester: Optional[EmailStr] = None
+    assigned_to_dev: Optional[str] = None
+    assigned_to_tester: Optional[str] = None
     dev_status: Optional[DevStatus] = None
     tester_status: Optional[TesterStatus] = None
     remarks: List[str] = []
-    created_by: EmailStr
+    created_by: str
     created_at: datetime
     updated_at: datetime
-
-    class Config:
-        populate_by_name = True
-        json_encoders = {
-            datetime: lambda dt: dt.isoformat()
-        }
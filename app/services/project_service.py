@@ -1,144 +1,157 @@
+import asyncio
+from typing import Optional
 from app.utils.db_utils import projects_collection, task_collection
-from datetime import datetime
-from bson import ObjectId
+from datetime import datetime, timezone
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from app.utils.logger import logger
-from app.schemas.project_schema import ProjectResponse
+from app.services.task_service import TASK_LIST_FIELDS
+from app.utils.common_utils import serialize_task, to_object_id
+from cachetools import TTLCache
+
+PROJECT_CACHE_TTL_SECONDS = 60
+
+# Fields served back to clients (ProjectResponse)
+PROJECT_FIELDS = {"name": 1, "description": 1, "status": 1, "created_by": 1, "created_at": 1, "updated_at": 1}
+
+# Project documents keyed by project_id. Only the project itself is cached, its tasks
+# are always read fresh; update/delete invalidate the entry.
+_project_cache = TTLCache(maxsize=1024, ttl=PROJECT_CACHE_TTL_SECONDS)
+
+def _serialize_project(doc: dict, tasks: Optional[list] = None) -> dict:
+    # Stored documents already have the ProjectResponse shape, so only the id needs renaming
+    doc["id"] = str(doc.pop("_id"))
+    doc.setdefault("description", None)
+    if tasks is not None:
+        doc["tasks"] = [serialize_task(t) for t in tasks]
+    return doc
 
 async def create_project(user_id: str, project_data: dict) -> dict:
     try:
-        # Case-insensitive duplicate check
-        existing_project = await projects_collection.find_one(
-            {"name": {"$regex": f"^{project_data['name']}$", "$options": "i"}}
-        )
-        if existing_project:
-            return {"success": False, "message": "Project with this name already exists"}
-
         # Add metadata
         project_data["created_by"] = user_id
-        project_data["created_at"] = datetime.utcnow()
-        project_data["updated_at"] = datetime.utcnow()
-
-        result = await projects_collection.insert_one(project_data)
-
-        # Build response using Pydantic
-        project_resp = ProjectResponse(
-            id=str(result.inserted_id),
-            name=project_data["name"],
-            description=project_data.get("description"),
-            status=project_data.get("status", "active"),
-            created_by=project_data["created_by"],
-            created_at=project_data["created_at"],
-            updated_at=project_data["updated_at"],
-        )
-
-        project_resp_dict = project_resp.model_dump()
-        project_resp_dict["tasks"] = []
-
-        logger.info(f"Project created: {project_data['name']} by user_id={user_id}")
+        project_data["created_at"] = project_data["updated_at"] = datetime.now(timezone.utc)
+
+        # Case-insensitive uniqueness is enforced by the collated unique index on name
+        try:
+            await projects_collection.insert_one(project_data)
+        except DuplicateKeyError:
+            return {"success": False, "message": "Project with this name already exists"}
+
+        # insert_one sets _id on project_data
+        project_resp_dict = _serialize_project(project_data, [])
+
+        logger.info("Project created: %s by user_id=%s", project_data['name'], user_id)
         return {"success": True, "data": project_resp_dict}
 
     except Exception as e:
-        logger.error(f"Error creating project: {e}")
+        logger.error("Error creating project: %s", e)
         return {"success": False, "message": "Internal server error"}
 
 
 async def update_project(project_id: str, update_data: dict) -> dict:
     try:
-        update_data["updated_at"] = datetime.utcnow()
-        result = await projects_collection.update_one({"_id": ObjectId(project_id)}, {"$set": update_data})
-        if result.matched_count == 0:
+        oid = to_object_id(project_id)
+        update_data["updated_at"] = datetime.now(timezone.utc)
+        try:
+            # Update and re-read in one round trip, fetching the tasks alongside
+            project, tasks = await asyncio.gather(
+                projects_collection.find_one_and_update(
+                    {"_id": oid}, {"$set": update_data}, projection=PROJECT_FIELDS, return_document=ReturnDocument.AFTER
+                ),
+                task_collection.find({"project_id": project_id}, TASK_LIST_FIELDS).to_list(100),
+            )
+        except DuplicateKeyError:
+            return {"success": False, "message": "Project with this name already exists"}
+        if project is None:
             return {"success": False, "message": "Project not found"}
 
-        project = await projects_collection.find_one({"_id": ObjectId(project_id)})
-        project["id"] = str(project["_id"])
-        project["tasks"] = await task_collection.find({"project_id": project_id}).to_list(100)
-
-        project_resp = ProjectResponse(
-            id=project["id"],
-            name=project["name"],
-            description=project.get("description"),
-            status=project["status"],
-            created_by=project["created_by"],
-            created_at=project["created_at"],
-            updated_at=project["updated_at"],
-        )
-        project_dict = project_resp.model_dump()
-        project_dict["tasks"] = project["tasks"]
+        _project_cache.pop(project_id, None)
 
+        project_dict = _serialize_project(project, tasks)
         return {"success": True, "data": project_dict}
 
     except Exception as e:
-        logger.error(f"Error updating project: {e}")
+        logger.error("Error updating project: %s", e)
         return {"success": False, "message": "Internal server error"}
 
 
 async def get_project(project_id: str) -> dict:
     try:
-        project = await projects_collection.find_one({"_id": ObjectId(project_id)})
-        if not project:
-            return {"success": False, "message": "Project not found"}
+        project = _project_cache.get(project_id)
+        if project is None:
+            oid = to_object_id(project_id)
+            # Independent reads, so overlap them; a missing project just discards the (empty) task list
+            project, tasks = await asyncio.gather(
+                projects_collection.find_one({"_id": oid}, PROJECT_FIELDS),
+                task_collection.find({"project_id": project_id}, TASK_LIST_FIELDS).to_list(100),
+            )
+            if not project:
+                return {"success": False, "message": "Project not found"}
+            _project_cache[project_id] = project
+        else:
+            tasks = await task_collection.find({"project_id": project_id}, TASK_LIST_FIELDS).to_list(100)
 
-        project["id"] = str(project["_id"])
-        project["tasks"] = await task_collection.find({"project_id": project_id}).to_list(100)
-
-        project_resp = ProjectResponse(
-            id=project["id"],
-            name=project["name"],
-            description=project.get("description"),
-            status=project["status"],
-            created_by=project["created_by"],
-            created_at=project["created_at"],
-            updated_at=project["updated_at"],
-        )
-        project_dict = project_resp.model_dump()
-        project_dict["tasks"] = project["tasks"]
+        # The cached document is shared, serialize a copy
+        project_dict = _serialize_project(dict(project), tasks)
 
         return {"success": True, "data": project_dict}
     except Exception as e:
-        logger.error(f"Error fetching project: {e}")
+        logger.error("Error fetching project: %s", e)
         return {"success": False, "message": "Internal server error"}
 
-async def list_projects(user) -> dict:
+async def project_exists(project_id: str) -> bool:
+    # Served from the project cache when possible; otherwise an _id-only lookup
+    if project_id in _project_cache:
+        return True
+    return await projects_collection.find_one({"_id": to_object_id(project_id)}, {"_id": 1}) is not None
+
+async def list_projects(user: dict) -> dict:
     try:
-        if user.role == "admin":
-            projects_cursor = projects_collection.find()
+        if user["role"] == "admin":
+            match = {}
         else:
             # Only projects where the user is a member
-            projects_cursor = projects_collection.find({"members": user.id})
-
-        projects = await projects_cursor.to_list(100)
+            match = {"members": user["user_id"]}
+
+        # Summaries only: each project carries a task_count, its tasks are paged from
+        # /projects/{id}/tasks. The count is joined server-side in the same round trip
+        # (tasks.project_id holds the string form of the project _id; localField + pipeline needs MongoDB 5.0+).
+        pipeline = [
+            {"$match": match},
+            {"$limit": 100},
+            {"$project": {**PROJECT_FIELDS, "id_str": {"$toString": "$_id"}}},
+            {"$lookup": {
+                "from": task_collection.name,
+                "localField": "id_str",
+                "foreignField": "project_id",
+                "pipeline": [{"$count": "n"}],
+                "as": "task_count",
+            }},
+            {"$set": {"task_count": {"$ifNull": [{"$arrayElemAt": ["$task_count.n", 0]}, 0]}}},
+        ]
+        cursor = await projects_collection.aggregate(pipeline)
         project_list = []
 
-        for p in projects:
-            p["id"] = str(p["_id"])
-            tasks = await task_collection.find({"project_id": p["id"]}).to_list(100)
-            project_resp = ProjectResponse(
-                id=p["id"],
-                name=p["name"],
-                description=p.get("description"),
-                status=p["status"],
-                created_by=p["created_by"],
-                created_at=p["created_at"],
-                updated_at=p["updated_at"],
-            )
-            project_dict = project_resp.model_dump()
-            project_dict["tasks"] = tasks
-            project_list.append(project_dict)
+        async for p in cursor:
+            p["_id"] = p.pop("id_str")
+            project_list.append(_serialize_project(p))
 
         return {"success": True, "data": project_list}
     except Exception as e:
-        logger.error(f"Error listing projects: {e}")
+        logger.error("Error listing projects: %s", e)
         return {"success": False, "message": "Internal server error"}
 
 
 async def delete_project(project_id: str) -> dict:
     try:
-        result = await projects_collection.delete_one({"_id": ObjectId(project_id)})
+        result = await projects_collection.delete_one({"_id": to_object_id(project_id)})
         if result.deleted_count == 0:
             return {"success": False, "message": "Project not found"}
+        _project_cache.pop(project_id, None)
 
         await task_collection.delete_many({"project_id": project_id})
         return {"success": True, "message": "Project and its tasks deleted successfully"}
     except Exception as e:
-        logger.error(f"Error deleting project: {e}")
+        logger.error("Error deleting project: %s", e)
         return {"success": False, "message": "Internal server error"}
@@ -1,7 +1,6 @@
-from http.client import HTTPException
+from fastapi import HTTPException
 from typing import Optional, List, Dict, Any
-from datetime import datetime
-from bson import ObjectId
+from datetime import datetime, timezone
 from pymongo import ReturnDocument
 from app.utils.db_utils import task_collection
 from app.schemas.task_schema import (
@@ -13,33 +12,28 @@ from app.schemas.task_schema import (
     DevStatus,
     TesterStatus
 )
+from app.utils.common_utils import serialize_task, to_object_id
 from app.utils.db_utils import users_collection
 from app.utils.logger import logger  
 
 # --- Helpers ---------------------------------------------------------------
 
-def _oid(id_str: str) -> ObjectId:
-    try:
-        return ObjectId(id_str)
-    except Exception:
-        raise ValueError("Invalid id")
-
-def _serialize_task(doc: Dict[str, Any]) -> Dict[str, Any]:
-    if not doc:
-        return None
-    doc["id"] = str(doc.pop("_id"))
-    doc.setdefault("assigned_to_dev", None)
-    doc.setdefault("assigned_to_tester", None)
-    doc.setdefault("dev_status", None)
-    doc.setdefault("tester_status", None)
-    doc.setdefault("remarks", [])
-    return doc
+# Fields served back to clients (TaskOut); reads project to these so nothing else crosses the wire
+TASK_FIELDS = {
+    "title": 1, "description": 1, "priority": 1, "due_date": 1, "project_id": 1, "created_by": 1,
+    "assigned_to_dev": 1, "assigned_to_tester": 1, "dev_status": 1, "tester_status": 1,
+    "remarks": 1, "created_at": 1, "updated_at": 1,
+}
+# List endpoints only carry the most recent remarks
+TASK_LIST_FIELDS = {**TASK_FIELDS, "remarks": {"$slice": -20}}
+TASK_PAGE_SIZE = 100
+TASK_BATCH_SIZE = 200
 
 # --- Create ----------------------------------------------------------------
 
 async def create_task(task_data: TaskCreate) -> Dict[str, Any]:
-    now = datetime.utcnow()
-    doc = task_data.dict()
+    now = datetime.now(timezone.utc)
+    doc = task_data.model_dump()
     assigned_dev = doc.get("assigned_to_dev")
     assigned_tester = doc.get("assigned_to_tester")
     doc["dev_status"] = DevStatus.pending.value if assigned_dev else None
@@ -48,225 +42,243 @@ async def create_task(task_data: TaskCreate) -> Dict[str, Any]:
     doc["created_at"] = now
     doc["updated_at"] = now
 
+    # insert_one sets doc["_id"], and doc already holds every stored field, so no re-read
     result = await task_collection.insert_one(doc)
-    created = await task_collection.find_one({"_id": result.inserted_id})
-    
-    logger.info(f"Task created: {doc.get('title')} by {doc.get('created_by')} (ID: {str(result.inserted_id)})")
-    return _serialize_task(created)
+
+    logger.info("Task created: %s by %s (ID: %s)", doc.get('title'), doc.get('created_by'), result.inserted_id)
+    return serialize_task(doc)
 
 # --- Get -------------------------------------------------------------------
 
 async def get_task_by_id(task_id: str) -> Optional[Dict[str, Any]]:
     try:
-        oid = _oid(task_id)
+        oid = to_object_id(task_id)
     except ValueError:
-        logger.error(f"Invalid task ID format: {task_id}")
+        logger.error("Invalid task ID format: %s", task_id)
         return None
-    doc = await task_collection.find_one({"_id": oid})
-    return _serialize_task(doc)
+    doc = await task_collection.find_one({"_id": oid}, TASK_FIELDS)
+    return serialize_task(doc)
 
 # --- Assign (Admin/Manager) ------------------------------------------------
 
+def _assignment_update(fields: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Pipeline update that sets `fields` and, when a developer/tester is assigned, moves an
+    unset status to 'pending' server-side, so no pre-read of the task is needed.
+    Values are wrapped in $literal so strings starting with "$" are not read as field paths;
+    updated_at is stamped by the server ($$NOW).
+    """
+    stage = {k: {"$literal": v} for k, v in fields.items()}
+    if "assigned_to_dev" in fields:
+        stage["dev_status"] = {"$ifNull": ["$dev_status", DevStatus.pending.value]}
+    if "assigned_to_tester" in fields:
+        stage["tester_status"] = {"$ifNull": ["$tester_status", TesterStatus.pending.value]}
+    stage["updated_at"] = "$$NOW"
+    return [{"$set": stage}]
+
 async def assign_task(task_id: str, developer: Optional[str] = None, tester: Optional[str] = None) -> Dict[str, Any]:
     """
     Assign developer and/or tester. Validates that users exist.
     Auto-sets dev_status/tester_status to 'pending' when assignment happens.
     Returns updated task.
     """
-    oid = _oid(task_id)
-    task = await task_collection.find_one({"_id": oid})
-    if not task:
-        logger.error(f"Task not found for assignment: {task_id}")
-        raise ValueError("Task not found")
-
+    oid = to_object_id(task_id)
     update = {}
 
-    # --- Validate developer ---
-    if developer is not None:
-        dev_user = await users_collection.find_one({"email": developer, "role": "developer"})
-        if not dev_user:
-            logger.warning(f"Assignment failed: Developer {developer} not found")
-            raise HTTPException(status_code=400, detail=f"Developer {developer} does not exist")
-        update["assigned_to_dev"] = developer
-        if not task.get("dev_status"):
-            update["dev_status"] = DevStatus.pending.value
-
-    # --- Validate tester ---
-    if tester is not None:
-        tester_user = await users_collection.find_one({"email": tester, "role": "tester"})
-        if not tester_user:
-            logger.warning(f"Assignment failed: Tester {tester} not found")
-            raise HTTPException(status_code=400, detail=f"Tester {tester} does not exist")
-        update["assigned_to_tester"] = tester
-        if not task.get("tester_status"):
-            update["tester_status"] = TesterStatus.pending.value
+    # --- Validate developer/tester in one query ---
+    wanted = {email: role for email, role in ((developer, "developer"), (tester, "tester")) if email is not None}
+    if wanted:
+        found = await users_collection.find(
+            {"email": {"$in": list(wanted)}}, {"_id": 0, "email": 1, "role": 1}
+        ).to_list(len(wanted))
+        roles = {u["email"]: u["role"] for u in found}
+        if developer is not None:
+            if roles.get(developer) != "developer":
+                logger.warning("Assignment failed: Developer %s not found", developer)
+                raise HTTPException(status_code=400, detail=f"Developer {developer} does not exist")
+            update["assigned_to_dev"] = developer
+        if tester is not None:
+            if roles.get(tester) != "tester":
+                logger.warning("Assignment failed: Tester %s not found", tester)
+                raise HTTPException(status_code=400, detail=f"Tester {tester} does not exist")
+            update["assigned_to_tester"] = tester
 
     if not update:
-        logger.info(f"No changes for task assignment: {task_id}")
-        return _serialize_task(task)
+        task = await task_collection.find_one({"_id": oid}, TASK_FIELDS)
+        if not task:
+            logger.error("Task not found for assignment: %s", task_id)
+            raise ValueError("Task not found")
+        logger.info("No changes for task assignment: %s", task_id)
+        return serialize_task(task)
 
-    update["updated_at"] = datetime.utcnow()
     updated_task = await task_collection.find_one_and_update(
-        {"_id": oid}, {"$set": update}, return_document=ReturnDocument.AFTER
+        {"_id": oid}, _assignment_update(update), projection=TASK_FIELDS, return_document=ReturnDocument.AFTER
     )
+    if not updated_task:
+        logger.error("Task not found for assignment: %s", task_id)
+        raise ValueError("Task not found")
 
     logger.info(
-        f"Task {task_id} assigned successfully by service. Dev: {developer}, Tester: {tester}"
+        "Task %s assigned successfully by service. Dev: %s, Tester: %s", task_id, developer, tester
     )
-    return _serialize_task(updated_task)
+    return serialize_task(updated_task)
 
 
 # --- Admin full update -----------------------------------------------------
 
-async def update_task_admin(task_id: str, payload: TaskUpdateAdmin) -> Dict[str, Any]:
-    oid = _oid(task_id)
-    current = await task_collection.find_one({"_id": oid})
-    if not current:
-        logger.error(f"Admin tried updating non-existent task: {task_id}")
-        raise ValueError("Task not found")
-
-    data = payload.dict(exclude_none=True)
-    to_set = {}
-    for f in ["title", "description", "priority", "due_date", "assigned_to_dev", "assigned_to_tester"]:
-        if f in data:
-            to_set[f] = data[f]
+# Fields an admin/manager may set directly (statuses only move through the dev/tester flows)
+ADMIN_UPDATE_FIELDS = {"title", "description", "priority", "due_date", "assigned_to_dev", "assigned_to_tester"}
 
-    if "assigned_to_dev" in to_set and not current.get("dev_status"):
-        to_set["dev_status"] = DevStatus.pending.value
-    if "assigned_to_tester" in to_set and not current.get("tester_status"):
-        to_set["tester_status"] = TesterStatus.pending.value
+async def update_task_admin(task_id: str, payload: TaskUpdateAdmin) -> Dict[str, Any]:
+    oid = to_object_id(task_id)
+    to_set = payload.model_dump(exclude_unset=True, exclude_none=True, include=ADMIN_UPDATE_FIELDS)
 
     if to_set:
-        to_set["updated_at"] = datetime.utcnow()
         updated = await task_collection.find_one_and_update(
-            {"_id": oid}, {"$set": to_set}, return_document=ReturnDocument.AFTER
+            {"_id": oid}, _assignment_update(to_set), projection=TASK_FIELDS, return_document=ReturnDocument.AFTER
         )
-        logger.info(f"Task {task_id} updated by Admin/Manager")
-        return _serialize_task(updated)
+        if not updated:
+            logger.error("Admin tried updating non-existent task: %s", task_id)
+            raise ValueError("Task not found")
+        logger.info("Task %s updated by Admin/Manager", task_id)
+        return serialize_task(updated)
 
-    return _serialize_task(current)
+    current = await task_collection.find_one({"_id": oid}, TASK_FIELDS)
+    if not current:
+        logger.error("Admin tried updating non-existent task: %s", task_id)
+        raise ValueError("Task not found")
+    return serialize_task(current)
 
 # --- Developer updates -----------------------------------------------------
+# Mutations put the assignment check in the update filter, so the common path is a single
+# find_one_and_update. Only when nothing matched is the task re-read to pick the error.
 
 async def update_dev_status(task_id: str, user_email: str, payload: TaskUpdateDeveloper) -> Dict[str, Any]:
-    oid = _oid(task_id)
-    task = await task_collection.find_one({"_id": oid})
-    if not task:
-        logger.error(f"Developer {user_email} tried updating non-existent task: {task_id}")
-        raise ValueError("Task not found")
-
-    if task.get("assigned_to_dev") != user_email:
-        logger.warning(f"Unauthorized Dev {user_email} attempted status update for task {task_id}")
-        raise PermissionError("Task not assigned to this developer")
-
+    oid = to_object_id(task_id)
     new_status = payload.dev_status.value if isinstance(payload.dev_status, DevStatus) else payload.dev_status
-    update = {"dev_status": new_status, "updated_at": datetime.utcnow()}
+    update = {"dev_status": new_status, "updated_at": "$$NOW"}
     updated = await task_collection.find_one_and_update(
-        {"_id": oid}, {"$set": update}, return_document=ReturnDocument.AFTER
+        {"_id": oid, "assigned_to_dev": user_email}, [{"$set": update}], projection=TASK_FIELDS, return_document=ReturnDocument.AFTER
     )
-    logger.info(f"Developer {user_email} updated status for Task {task_id} → {new_status}")
-    return _serialize_task(updated)
-
-async def append_dev_remarks(task_id: str, user_email: str, payload: TaskAppendRemarks) -> Dict[str, Any]:
-    oid = _oid(task_id)
-    task = await task_collection.find_one({"_id": oid})
-    if not task:
-        logger.error(f"Developer {user_email} tried adding remarks to non-existent task: {task_id}")
-        raise ValueError("Task not found")
-    if task.get("assigned_to_dev") != user_email:
-        logger.warning(f"Unauthorized Dev {user_email} attempted to add remarks for task {task_id}")
+    if not updated:
+        if not await task_collection.find_one({"_id": oid}, {"_id": 1}):
+            logger.error("Developer %s tried updating non-existent task: %s", user_email, task_id)
+            raise ValueError("Task not found")
+        logger.warning("Unauthorized Dev %s attempted status update for task %s", user_email, task_id)
         raise PermissionError("Task not assigned to this developer")
 
-    now = datetime.utcnow()
-    tagged = [f"DEV ({user_email}) [{now.isoformat()}]: {r}" for r in payload.remarks]
+    logger.info("Developer %s updated status for Task %s → %s", user_email, task_id, new_status)
+    return serialize_task(updated)
+
+async def append_dev_remarks(task_id: str, user_email: str, payload: TaskAppendRemarks) -> Dict[str, Any]:
+    oid = to_object_id(task_id)
+    now = datetime.now(timezone.utc)
+    prefix = f"DEV ({user_email}) [{now.isoformat()}]: "
+    tagged = [prefix + r for r in payload.remarks]
     updated = await task_collection.find_one_and_update(
-        {"_id": oid},
+        {"_id": oid, "assigned_to_dev": user_email},
         {"$push": {"remarks": {"$each": tagged}}, "$set": {"updated_at": now}},
-        return_document=ReturnDocument.AFTER,
+        projection=TASK_FIELDS, return_document=ReturnDocument.AFTER,
     )
-    logger.info(f"Developer {user_email} added remarks to Task {task_id}")
-    return _serialize_task(updated)
+    if not updated:
+        if not await task_collection.find_one({"_id": oid}, {"_id": 1}):
+            logger.error("Developer %s tried adding remarks to non-existent task: %s", user_email, task_id)
+            raise ValueError("Task not found")
+        logger.warning("Unauthorized Dev %s attempted to add remarks for task %s", user_email, task_id)
+        raise PermissionError("Task not assigned to this developer")
+
+    logger.info("Developer %s added remarks to Task %s", user_email, task_id)
+    return serialize_task(updated)
 
 # --- Tester updates --------------------------------------------------------
 
 async def update_tester_status(task_id: str, user_email: str, payload: TaskUpdateTester) -> Dict[str, Any]:
-    oid = _oid(task_id)
-    task = await task_collection.find_one({"_id": oid})
-    if not task:
-        logger.error(f"Tester {user_email} tried updating non-existent task: {task_id}")
-        raise ValueError("Task not found")
-    if task.get("assigned_to_tester") != user_email:
-        logger.warning(f"Unauthorized Tester {user_email} attempted status update for task {task_id}")
-        raise PermissionError("Task not assigned to this tester")
-
-    if task.get("dev_status") != DevStatus.completed.value:
-        logger.warning(f"Tester {user_email} attempted to update status before Dev completed task {task_id}")
-        raise PermissionError("Developer must complete the task before tester can update status")
-
+    oid = to_object_id(task_id)
     update = {
         "tester_status": payload.tester_status.value if isinstance(payload.tester_status, TesterStatus) else payload.tester_status,
-        "updated_at": datetime.utcnow()
+        "updated_at": "$$NOW"
     }
 
     if payload.remarks is not None:
-        update["remarks"] = payload.remarks
+        update["remarks"] = {"$literal": payload.remarks}
 
     updated = await task_collection.find_one_and_update(
-        {"_id": oid}, {"$set": update}, return_document=ReturnDocument.AFTER
+        {"_id": oid, "assigned_to_tester": user_email, "dev_status": DevStatus.completed.value},
+        [{"$set": update}],
+        projection=TASK_FIELDS, return_document=ReturnDocument.AFTER,
     )
-    logger.info(f"Tester {user_email} updated status for Task {task_id}")
-    return _serialize_task(updated)
+    if not updated:
+        task = await task_collection.find_one({"_id": oid}, {"assigned_to_tester": 1})
+        if not task:
+            logger.error("Tester %s tried updating non-existent task: %s", user_email, task_id)
+            raise ValueError("Task not found")
+        if task.get("assigned_to_tester") != user_email:
+            logger.warning("Unauthorized Tester %s attempted status update for task %s", user_email, task_id)
+            raise PermissionError("Task not assigned to this tester")
+        logger.warning("Tester %s attempted to update status before Dev completed task %s", user_email, task_id)
+        raise PermissionError("Developer must complete the task before tester can update status")
 
-async def append_tester_remarks(task_id: str, user_email: str, payload: TaskAppendRemarks) -> Dict[str, Any]:
-    oid = _oid(task_id)
-    task = await task_collection.find_one({"_id": oid})
-    if not task:
-        logger.error(f"Tester {user_email} tried adding remarks to non-existent task: {task_id}")
-        raise ValueError("Task not found")
-    if task.get("assigned_to_tester") != user_email:
-        logger.warning(f"Unauthorized Tester {user_email} attempted to add remarks for task {task_id}")
-        raise PermissionError("Task not assigned to this tester")
+    logger.info("Tester %s updated status for Task %s", user_email, task_id)
+    return serialize_task(updated)
 
-    now = datetime.utcnow()
-    tagged = [f"TESTER ({user_email}) [{now.isoformat()}]: {r}" for r in payload.remarks]
+async def append_tester_remarks(task_id: str, user_email: str, payload: TaskAppendRemarks) -> Dict[str, Any]:
+    oid = to_object_id(task_id)
+    now = datetime.now(timezone.utc)
+    prefix = f"TESTER ({user_email}) [{now.isoformat()}]: "
+    tagged = [prefix + r for r in payload.remarks]
     updated = await task_collection.find_one_and_update(
-        {"_id": oid},
+        {"_id": oid, "assigned_to_tester": user_email},
         {"$push": {"remarks": {"$each": tagged}}, "$set": {"updated_at": now}},
-        return_document=ReturnDocument.AFTER,
+        projection=TASK_FIELDS, return_document=ReturnDocument.AFTER,
     )
-    logger.info(f"Tester {user_email} added remarks to Task {task_id}")
-    return _serialize_task(updated)
+    if not updated:
+        if not await task_collection.find_one({"_id": oid}, {"_id": 1}):
+            logger.error("Tester %s tried adding remarks to non-existent task: %s", user_email, task_id)
+            raise ValueError("Task not found")
+        logger.warning("Unauthorized Tester %s attempted to add remarks for task %s", user_email, task_id)
+        raise PermissionError("Task not assigned to this tester")
+
+    logger.info("Tester %s added remarks to Task %s", user_email, task_id)
+    return serialize_task(updated)
 
 # --- Delete ----------------------------------------------------------------
 
 async def delete_task(task_id: str) -> bool:
-    oid = _oid(task_id)
+    oid = to_object_id(task_id)
     result = await task_collection.delete_one({"_id": oid})
     if result.deleted_count == 1:
-        logger.warning(f"Task deleted: {task_id}")
+        logger.warning("Task deleted: %s", task_id)
         return True
     else:
-        logger.error(f"Failed to delete task: {task_id}")
+        logger.error("Failed to delete task: %s", task_id)
         return False
     
-async def get_all_tasks(filters: Dict[str, Any], current_user: dict) -> List[Dict[str, Any]]:
-    query = {k: v for k, v in filters.items() if v is not None}
-    cursor = task_collection.find(query)
-    tasks = await cursor.to_list(length=None)
-    return [_serialize_task(t) for t in tasks]
-
-async def get_my_tasks(current_user: dict) -> List[Dict[str, Any]]:
-    role = current_user["role"]
-    email = current_user["email"]
-
-    if role == "developer":
-        query = {"assigned_to_dev": email}
-    elif role == "tester":
-        query = {"assigned_to_tester": email}
-    else:
-        return []
+async def _task_page(query: Dict[str, Any], after: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """
+    Newest-first page of tasks matching `query`, keyed by _id: pass the last id of the
+    previous page as `after` to get the next one. The page is read in full before the
+    route builds its response, so a Mongo failure surfaces as an error status rather than
+    a 200 with a truncated body; pages are capped at 500 by the routes.
+    """
+    if after is not None:
+        query["_id"] = {"$lt": to_object_id(after)}
+    cursor = task_collection.find(query, TASK_LIST_FIELDS).sort("_id", -1).limit(limit).batch_size(TASK_BATCH_SIZE)
+    return [serialize_task(doc) for doc in await cursor.to_list(limit)]
 
-    cursor = task_collection.find(query)
-    tasks = await cursor.to_list(length=None)
-    return [_serialize_task(t) for t in tasks]
+# Role -> task field holding that role's assignment
+_ASSIGNEE_FIELD = {"developer": "assigned_to_dev", "tester": "assigned_to_tester"}
 
+async def get_all_tasks(filters: Dict[str, Any], current_user: dict, after: Optional[str] = None, limit: int = TASK_PAGE_SIZE) -> List[Dict[str, Any]]:
+    query = {k: v for k, v in filters.items() if v is not None}
+    # Developers/testers only see their own assignments; scope it in the query so Mongo
+    # resolves it with the assignee index in the same round trip
+    field = _ASSIGNEE_FIELD.get(current_user["role"])
+    if field:
+        query[field] = current_user["email"]
+    return await _task_page(query, after, limit)
+
+async def get_my_tasks(current_user: dict, after: Optional[str] = None, limit: int = TASK_PAGE_SIZE) -> List[Dict[str, Any]]:
+    field = _ASSIGNEE_FIELD.get(current_user["role"])
+    if not field:
+        return []
+    return await _task_page({field: current_user["email"]}, after, limit)
@@ -1,60 +1,80 @@
-from datetime import datetime, timedelta
+import asyncio
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta, timezone
 from app.utils.db_utils import users_collection,login_attempts_collection,password_resets_collection
 from app.schemas.user_schema import RegisterUser
-from app.utils.auth_utils import cleanup_expired_otps, create_jwt_token, generate_otp, get_user_by_email, hash_password, otp_expiry_time, send_otp_email, validate_password_strength, verify_password
+from app.utils.auth_utils import check_password, create_jwt_token, evict_missing_user, generate_otp, get_user_by_email, hash_password, otp_digest, otp_expiry_time, password_needs_rehash, send_otp_email, validate_password_strength
+from app.utils.audit_utils import record_login_attempt
 from app.utils.logger import logger
-from datetime import datetime
+
+# Fields login_user reads off the user document
+LOGIN_USER_FIELDS = {"email": 1, "password": 1, "role": 1, "locked_until": 1, "consecutive_failures": 1}
+
+MAX_FAILED_LOGINS = 5
+LOCK_DURATION = timedelta(hours=2)
 
 async def register_user(user: RegisterUser) -> tuple[bool, str]:
     try:
         # Check if user already exists
-        existing_user = await get_user_by_email(user.email)
+        existing_user = await get_user_by_email(user.email, {"_id": 1})
         if existing_user:
-            logger.warning(f"Registration failed: User already exists with email {user.email}")
+            logger.warning("Registration failed: User already exists with email %s", user.email)
             return False, "User already exists with this email."
 
         # Validate password strength
-        if not validate_password_strength(user.password):
-            logger.warning(f"Weak password attempt for email {user.email}")
-            return False, "Password does not meet the required strength."
+        valid, reason = validate_password_strength(user.password)
+        if not valid:
+            logger.warning("Weak password attempt for email %s", user.email)
+            return False, reason
 
-        # Hash password
-        hashed_pwd = hash_password(user.password)
+        # Hash password (bcrypt is CPU-bound, keep it off the event loop)
+        hashed_pwd = await hash_password(user.password)
 
         # Prepare user document
         user_data = user.model_dump()
         user_data["password"] = hashed_pwd
-        user_data["created_at"] = datetime.utcnow()
+        user_data["created_at"] = datetime.now(timezone.utc)
         user_data["date_of_birth"] = datetime.combine(user.date_of_birth, datetime.min.time())
         user_data["date_of_joining"] = datetime.combine(user.date_of_joining, datetime.min.time())
 
 
-        # Insert user
-        await users_collection.insert_one(user_data)
+        # Insert user; the unique email index catches a concurrent registration
+        try:
+            await users_collection.insert_one(user_data)
+        except DuplicateKeyError:
+            logger.warning("Registration failed: User already exists with email %s", user.email)
+            return False, "User already exists with this email."
+        finally:
+            # The existence check above remembered this email as missing
+            evict_missing_user(user.email)
 
-        logger.info(f"User registered successfully: {user.email}")
+        logger.info("User registered successfully: %s", user.email)
         return True, "User registered successfully."
 
     except Exception as e:
-        logger.error(f"Error during user registration: {str(e)}")
+        logger.error("Error during user registration: %s", e)
         return False, "Internal Server Error"
 
 async def login_user(email: str, password: str) -> dict:
-    existing_user = await get_user_by_email(email)
+    # One clock read for the whole attempt
+    now = datetime.now(timezone.utc)
+    existing_user = await get_user_by_email(email, LOGIN_USER_FIELDS)
     
     if not existing_user:
-        await login_attempts_collection.insert_one({
+        record_login_attempt({
             "email": email,
-            "timestamp": datetime.utcnow(),
+            "timestamp": now,
             "success": False,
         })
-        logger.warning(f"[LOGIN FAILED] User not found: email={email}")
+        logger.warning("[LOGIN FAILED] User not found: email=%s", email)
         return {"success": False, "message": "Invalid credentials", "data": None}
 
     if existing_user.get("locked_until"):
-        if datetime.utcnow() < existing_user["locked_until"]:
+        if now < existing_user["locked_until"]:
             logger.warning(
-                f"[ACCOUNT LOCKED] Login attempt on locked account: email={email}, locked_until={existing_user['locked_until']}"
+                "[ACCOUNT LOCKED] Login attempt on locked account: email=%s, locked_until=%s",
+                email, existing_user['locked_until']
             )
             return {
                 "success": False,
@@ -63,65 +83,73 @@ async def login_user(email: str, password: str) -> dict:
                 "data": None
             }
         else:
-            # Clear lock if time passed
+            # Clear lock if time passed; the lock served its purpose, so the count restarts
             await users_collection.update_one(
                 {"_id": existing_user["_id"]},
-                {"$set": {"locked_until": None}}
+                {"$set": {"locked_until": None, "consecutive_failures": 0}}
             )
-            logger.info(f"[LOCK CLEARED] Account unlocked automatically: email={email}")
-
-    # Fetch last 5 login attempts
-    last_attempts = await login_attempts_collection.find(
-        {"user_id": str(existing_user["_id"])}
-    ).sort("timestamp", -1).limit(5).to_list(5)
+            logger.info("[LOCK CLEARED] Account unlocked automatically: email=%s", email)
 
-    consecutive_failures = 0
-    for attempt in last_attempts:
-        if not attempt["success"]:
-            consecutive_failures += 1
-        else:
-            break  # Stop at first success
-
-    if consecutive_failures >= 5:
-        locked_until = datetime.utcnow() + timedelta(hours=2)
-        await users_collection.update_one(
+    password_valid = await check_password(password, existing_user["password"])
+    if not password_valid:
+        # Count the failure on the user document and lock in the same atomic update
+        # once the count reaches MAX_FAILED_LOGINS
+        locked_until = now + LOCK_DURATION
+        counted = await users_collection.find_one_and_update(
             {"_id": existing_user["_id"]},
-            {"$set": {"locked_until": locked_until}}
+            [
+                {"$set": {"consecutive_failures": {"$add": [{"$ifNull": ["$consecutive_failures", 0]}, 1]}}},
+                {"$set": {"locked_until": {"$cond": [
+                    {"$gte": ["$consecutive_failures", MAX_FAILED_LOGINS]}, locked_until, "$locked_until"
+                ]}}},
+            ],
+            projection={"consecutive_failures": 1},
+            return_document=ReturnDocument.AFTER,
         )
-        logger.warning(
-            f"[ACCOUNT LOCKED] 5 consecutive failed attempts: email={email}, locked_until={locked_until}"
-        )
-        return {
-            "success": False,
-            "message": "Account locked due to 5 consecutive failed attempts. Please reset your password.",
-            "action": "reset_password",
-            "data": None
-        }
-
-    password_valid = verify_password(password, existing_user["password"])
-    if not password_valid:
-        await login_attempts_collection.insert_one({
+        record_login_attempt({
             "user_id": str(existing_user["_id"]),
-            "timestamp": datetime.utcnow(),
+            "timestamp": now,
             "success": False,
         })
-        logger.warning(f"[LOGIN FAILED] Invalid password: email={email}")
+        if counted and counted["consecutive_failures"] >= MAX_FAILED_LOGINS:
+            logger.warning(
+                "[ACCOUNT LOCKED] %s consecutive failed attempts: email=%s, locked_until=%s",
+                MAX_FAILED_LOGINS, email, locked_until
+            )
+            return {
+                "success": False,
+                "message": f"Account locked due to {MAX_FAILED_LOGINS} consecutive failed attempts. Please reset your password.",
+                "action": "reset_password",
+                "data": None
+            }
+        logger.warning("[LOGIN FAILED] Invalid password: email=%s", email)
         return {"success": False, "message": "Invalid credentials", "data": None}
-    
+
     # Successful login
-    token = create_jwt_token(str(existing_user["_id"]), existing_user["role"])
-    
-    await login_attempts_collection.insert_one({
+    token = create_jwt_token(str(existing_user["_id"]), existing_user["role"], existing_user["email"])
+
+    # Awaited, unlike the failure records: /logout looks the session up by this document's token
+    writes = [login_attempts_collection.insert_one({
     "user_id": existing_user["_id"],
     "email": existing_user["email"],
     "token": token,
-    "login_time": datetime.utcnow(),
-    "expiry_time": datetime.utcnow() + timedelta(hours=24),
+    "login_time": now,
+    "expiry_time": now + timedelta(hours=24),
     "success": True,
     "expired": False,
     "logout_time": None
-})
-    logger.info(f"[LOGIN SUCCESS] User logged in: user_id={existing_user['_id']}, email={email}")
+})]
+    user_updates = {}
+    if existing_user.get("consecutive_failures"):
+        user_updates["consecutive_failures"] = 0
+    if password_needs_rehash(existing_user["password"]):
+        # Legacy bcrypt hash: the password was just verified, so upgrade it to Argon2id
+        user_updates["password"] = await hash_password(password)
+    if user_updates:
+        writes.append(users_collection.update_one({"_id": existing_user["_id"]}, {"$set": user_updates}))
+    # Independent collections, so the session insert and the counter reset go out together
+    await asyncio.gather(*writes)
+    logger.info("[LOGIN SUCCESS] User logged in: user_id=%s, email=%s", existing_user['_id'], email)
     
     return {
         "success": True,
@@ -139,50 +167,44 @@ async def login_user(email: str, password: str) -> dict:
 
 # Step 1: request password reset (generate OTP)
 async def request_password_reset(email: str) -> dict:
-    #
-    await cleanup_expired_otps()
-
-    otp = await generate_otp()
+    # Expired OTPs are reaped by the TTL index on expires_at
+    otp = generate_otp()
     expires_at = otp_expiry_time()
     
     await password_resets_collection.insert_one({
         "user_id": email,
-        "otp": otp,
+        "otp": otp_digest(otp),
         "expires_at": expires_at,
-        "created_at": datetime.utcnow()
+        "created_at": datetime.now(timezone.utc)
     })
     
     # send OTP via email
     sent = await send_otp_email(email, otp)
     if not sent:
         return {"success": False, "message": "Failed to send OTP"}
-    logger.info(f"Password reset OTP sent for email={email}")
+    logger.info("Password reset OTP sent for email=%s", email)
     
     return {"success": True, "message": "OTP sent to your email"}
 
 # Step 2: validate OTP
 async def validate_password_reset_otp(email: str, otp: str) -> dict:
     
-    record = await password_resets_collection.find_one({
+    # Match and consume in one step, so an OTP can only ever be used once
+    record = await password_resets_collection.find_one_and_delete({
         "user_id": email,
-        "otp": otp,
-        "expires_at": {"$gte": datetime.utcnow()}
-    })
+        "otp": otp_digest(otp),
+        "expires_at": {"$gte": datetime.now(timezone.utc)}
+    }, projection={"_id": 1})
     if not record:
-        logger.warning(f"Invalid or expired OTP ")
+        logger.warning("Invalid or expired OTP ")
         return {"success": False, "message": "Invalid or expired OTP"}
-    
-    # Delete OTP after successful validation
-    await password_resets_collection.delete_one({"_id": record["_id"]})
-    logger.info(f"[OTP VALIDATED] OTP validated and removed for email={email}")
 
-    
-    logger.info(f"OTP validated for user : {email}")
+    logger.info("OTP validated for user : %s", email)
     return {"success": True, "message": "OTP validated"}
 
 # Step 3: change password
 async def change_password(email: str, otp: str, new_password: str) -> dict:
-    user = await get_user_by_email(email)
+    user = await get_user_by_email(email, {"_id": 1})
     
     if not user:
         return {"success": False, "message": "User not found"}
@@ -197,20 +219,20 @@ async def change_password(email: str, otp: str, new_password: str) -> dict:
     if not valid:
         return {"success": False, "message": reason}
     
-    hashed = hash_password(new_password)
-    if not hashed:
-        return {"success": False, "message": "Error hashing password"}
+    hashed = await hash_password(new_password)
     
     await users_collection.update_one(
         {"_id": user["_id"]},
         {"$set": {
             "password": hashed,
-            "password_changed_at": datetime.utcnow(),
-            "locked_until": None
+            "password_changed_at": datetime.now(timezone.utc),
+            # The lock message sends users here, so a reset starts them from zero failures
+            "locked_until": None,
+            "consecutive_failures": 0
         }}
     )
     
-    logger.info(f"Password changed successfully for user_id={user['_id']}")
+    logger.info("Password changed successfully for user_id=%s", user['_id'])
     
     return {"success": True, "message": "Password changed successfully"}
 
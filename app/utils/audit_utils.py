@@ -0,0 +1,82 @@
+import asyncio
+from pymongo import WriteConcern
+from app.utils.db_utils import login_attempts_collection
+from app.utils.logger import logger
+
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_SECONDS = 0.5
+AUDIT_QUEUE_SIZE = 10_000
+
+# Failed-login records are telemetry only, so they are written unacknowledged
+_audit_collection = login_attempts_collection.with_options(write_concern=WriteConcern(w=0))
+
+_audit_queue: asyncio.Queue = asyncio.Queue(maxsize=AUDIT_QUEUE_SIZE)
+_writer_task: asyncio.Task | None = None
+
+
+def record_login_attempt(doc: dict) -> None:
+    """Queue an audit record for the background writer instead of awaiting an insert."""
+    try:
+        _audit_queue.put_nowait(doc)
+    except asyncio.QueueFull:
+        logger.warning("Audit queue full, dropping login attempt record")
+
+
+async def _flush(batch: list) -> None:
+    try:
+        await _audit_collection.insert_many(batch, ordered=False)
+    except Exception as e:
+        logger.error("Error writing %s login attempt records: %s", len(batch), e)
+
+
+# Queued by stop_audit_writer; the writer flushes its current batch and exits
+_STOP = object()
+
+
+async def _audit_writer() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        # Wait for the first record, then collect more until the batch or the window is full
+        doc = await _audit_queue.get()
+        if doc is _STOP:
+            return
+        batch = [doc]
+        deadline = loop.time() + AUDIT_FLUSH_SECONDS
+        while len(batch) < AUDIT_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                doc = await asyncio.wait_for(_audit_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if doc is _STOP:
+                await _flush(batch)
+                return
+            batch.append(doc)
+        await _flush(batch)
+
+
+def start_audit_writer() -> None:
+    global _writer_task
+    _writer_task = asyncio.create_task(_audit_writer())
+
+
+async def stop_audit_writer() -> None:
+    """
+    Stop the writer and flush whatever is still queued. The writer is not cancelled:
+    it finishes the insert in progress and the batch it holds before seeing the stop marker.
+    """
+    global _writer_task
+    if _writer_task is not None:
+        await _audit_queue.put(_STOP)
+        await _writer_task
+        _writer_task = None
+    # Records queued after the stop marker
+    batch = []
+    while not _audit_queue.empty():
+        doc = _audit_queue.get_nowait()
+        if doc is not _STOP:
+            batch.append(doc)
+    if batch:
+        await _flush(batch)
@@ -1,125 +1,232 @@
-from datetime import datetime, timedelta
+import asyncio
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from email.mime.text import MIMEText
-import random
-import re
+import hashlib
+import hmac
+import os
+import secrets
 import smtplib
+import string
+import time
 import jwt
-from fastapi import Header, HTTPException
+from cachetools import TTLCache
+from fastapi import Depends, Header, HTTPException, Request
 from passlib.context import CryptContext
 from app.config import EMAIL_HOST, EMAIL_PASS, EMAIL_PORT, EMAIL_USER, SECRET_KEY, ALGORITHM
 from app.utils.logger import logger
-from app.utils.db_utils import users_collection,password_resets_collection
+from app.utils.db_utils import users_collection
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# New hashes are Argon2id (libargon2 via argon2-cffi). bcrypt stays listed so existing hashes
+# still verify; deprecated="auto" marks them for rehashing on the next successful login.
+# Costs pinned explicitly rather than left to the passlib defaults, and not lowered:
+# verification already runs in a worker thread, so the cost only bounds login throughput
+BCRYPT_ROUNDS = 12
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=2,
+    argon2__memory_cost=65536,
+    argon2__parallelism=4,
+    bcrypt__rounds=BCRYPT_ROUNDS,
+)
+
+# Dedicated pool for hashing so slow verifications can't exhaust the default executor that
+# asyncio.to_thread shares with SMTP. Threads rather than processes: both backends release
+# the GIL while hashing, so this already uses every core without pickling per call
+_HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="pwhash")
 
 
 # -------------------------
 # Password hashing & verification
 # -------------------------
-def hash_password(password: str) -> str:
-    """Hash a plain password using bcrypt."""
-    try:
-        hashed = pwd_context.hash(password)
-        logger.info("Password hashed successfully")
-        return hashed
-    except Exception as e:
-        logger.error(f"Error hashing password: {e}")
-        return None
+async def hash_password(password: str) -> str:
+    """Hash a plain password using Argon2id, off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_HASH_POOL, pwd_context.hash, password)
+
+
+_BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+_BCRYPT_HASH_LEN = 60
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a plain password against a hashed password."""
     try:
-        is_valid = pwd_context.verify(plain_password, hashed_password)
-        logger.info(f"Password verification: {is_valid}")
-        return is_valid
-    except Exception as e:
-        logger.error(f"Error verifying password: {e}")
+        if hashed_password.startswith(_BCRYPT_PREFIXES):
+            # Legacy hashes go straight to the bcrypt module, skipping passlib's dispatch.
+            # The length check stands in for passlib's parsing: bcrypt panics on short hashes
+            if len(hashed_password) != _BCRYPT_HASH_LEN:
+                raise ValueError("malformed bcrypt hash")
+            return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+        return pwd_context.verify(plain_password, hashed_password)
+    except ValueError:
+        # Recognised prefix but a malformed hash (truncated, bad salt): no password matches it
+        logger.error("Malformed password hash rejected")
         return False
 
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True for hashes from a deprecated scheme or older cost settings."""
+    return pwd_context.needs_update(hashed_password)
+
+
+VERIFY_CACHE_TTL_SECONDS = 30
+
+# Successful verifications keyed by an HMAC of (password, hash), so neither the plaintext
+# nor anything usable offline is kept. Failures are never cached, and a password change
+# produces a new hash and therefore a new key.
+_verify_cache = TTLCache(maxsize=1024, ttl=VERIFY_CACHE_TTL_SECONDS)
+
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    """verify_password in the hashing pool, skipping it for a recently verified pair."""
+    # Empty or unrecognised hashes can never verify; reject them before the expensive hash
+    if not hashed_password or pwd_context.identify(hashed_password) is None:
+        return False
+    key = hmac.new(SECRET_KEY.encode(), f"{plain_password}|{hashed_password}".encode(), hashlib.sha256).digest()
+    if key in _verify_cache:
+        return True
+    is_valid = await asyncio.get_running_loop().run_in_executor(
+        _HASH_POOL, verify_password, plain_password, hashed_password
+    )
+    if is_valid:
+        _verify_cache[key] = True
+    return is_valid
+
+
 # -------------------------
 # Password strength validation
 # -------------------------
+_UPPER = frozenset(string.ascii_uppercase)
+_LOWER = frozenset(string.ascii_lowercase)
+_DIGITS = frozenset(string.digits)
+_SPECIAL = frozenset('!@#$%^&*(),.?":{}|<>')
+
+
 def validate_password_strength(password: str) -> (bool, str):
     """Check password strength."""
-    try:
-        if len(password) < 8:
-            return False, "Password must be at least 8 characters long."
-        if not re.search(r"[A-Z]", password):
-            return False, "Password must contain at least one uppercase letter."
-        if not re.search(r"[a-z]", password):
-            return False, "Password must contain at least one lowercase letter."
-        if not re.search(r"\d", password):
-            return False, "Password must contain at least one digit."
-        if not re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
-            return False, "Password must contain at least one special character."
-
-        logger.info("Password strength validation passed")
-        return True, ""
-    except Exception as e:
-        logger.error(f"Error validating password strength: {e}")
-        return False, "Internal error during password validation."
+    if len(password) < 8:
+        return False, "Password must be at least 8 characters long."
+    # One pass over the password; the class checks are then set operations in C
+    chars = set(password)
+    if chars.isdisjoint(_UPPER):
+        return False, "Password must contain at least one uppercase letter."
+    if chars.isdisjoint(_LOWER):
+        return False, "Password must contain at least one lowercase letter."
+    if chars.isdisjoint(_DIGITS):
+        return False, "Password must contain at least one digit."
+    if chars.isdisjoint(_SPECIAL):
+        return False, "Password must contain at least one special character."
+    return True, ""
 
 
 # -------------------------
 # JWT token creation & decoding
 # -------------------------
 ACCESS_TOKEN_EXPIRE_HOURS=24
+_ACCESS_TOKEN_EXPIRE_SECONDS = ACCESS_TOKEN_EXPIRE_HOURS * 3600
+
+# Built once instead of per call. HMAC algorithms in PyJWT already go through the
+# stdlib hmac module (OpenSSL), so no extra crypto backend is involved
+_JWT_KEY = SECRET_KEY.encode()
+_JWT_ALGORITHMS = [ALGORITHM]
 
-def create_jwt_token(user_id: str, role: str) -> str:
+def create_jwt_token(user_id: str, role: str, email: str) -> str:
     """Create a JWT token for a user."""
-    try:
-        expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
-        payload = {"user_id": user_id, "role": role, "exp": expire}
-        token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
-        logger.info(f"JWT token created for user_id={user_id}")
-        return token
-    except Exception as e:
-        logger.error(f"Error creating JWT token: {e}")
-        return None
+    # email is carried so task routes and list scoping can match assignees without a user lookup.
+    # NumericDate (RFC 7519) straight from the clock; PyJWT would convert a datetime to this anyway
+    payload = {
+        "user_id": user_id,
+        "role": role,
+        "email": email,
+        "exp": int(time.time()) + _ACCESS_TOKEN_EXPIRE_SECONDS,
+    }
+    token = jwt.encode(payload, _JWT_KEY, algorithm=ALGORITHM)
+    logger.debug("JWT token created for user_id=%s", user_id)
+    return token
 
 
 def decode_jwt_token(token: str) -> dict:
     """Decode a JWT token and return payload."""
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        logger.info(f"JWT token decoded successfully for user_id={payload.get('user_id')}")
-        return {"success": True, "data": payload}
+        payload = jwt.decode(token, _JWT_KEY, algorithms=_JWT_ALGORITHMS)
     except jwt.ExpiredSignatureError:
         logger.warning("JWT token expired")
         return {"success": False, "message": "Token expired"}
     except jwt.InvalidTokenError:
         logger.warning("JWT token invalid")
         return {"success": False, "message": "Invalid token"}
+    logger.debug("JWT token decoded for user_id=%s", payload.get("user_id"))
+    return {"success": True, "data": payload}
 
 
 # -------------------------
 # Database helper
 # -------------------------
-async def get_user_by_email(email: str) -> dict | None:
+MISSING_USER_CACHE_TTL_SECONDS = 5
+
+# Found users are never cached: login reads the password hash and lock state through
+# here, and a per-process copy would keep serving them on other workers after a change.
+# Emails that just had no user are remembered, so repeated logins for unknown accounts
+# (credential stuffing) skip Mongo. Kept short: a registration handled by another worker
+# is only invisible here for this long, and register_user evicts the entry in this one
+_missing_user_cache = TTLCache(maxsize=10_000, ttl=MISSING_USER_CACHE_TTL_SECONDS)
+
+
+# One Mongo lookup per (email, projection) at a time; concurrent callers await the same task
+_inflight_user_lookups: dict[tuple, asyncio.Task] = {}
+
+
+def evict_missing_user(email: str) -> None:
+    """Forget that an email had no user (after registering it)."""
+    _missing_user_cache.pop(email, None)
+
+
+async def get_user_by_email(email: str, projection: dict | None = None) -> dict | None:
     """
     Fetch a user by email from the database.
+    Pass `projection` to fetch only the fields the caller needs.
     Returns the user document if found, else None.
     """
-    try:
-        user = await users_collection.find_one({"email": email})
-        if user:
-            logger.info(f"User found with email: {email}")
-        return user
-    except Exception as e:
-        logger.error(f"Error fetching user by email ({email}): {e}")
+    if email in _missing_user_cache:
         return None
+    # Keyed on the projection's values as well as its keys, so {"password": 1} and
+    # {"password": 0} never share a result; repr keeps operator values ($slice...) hashable
+    key = (email, tuple(sorted((k, repr(v)) for k, v in projection.items())) if projection else None)
+    lookup = _inflight_user_lookups.get(key)
+    if lookup is None:
+        lookup = asyncio.ensure_future(users_collection.find_one({"email": email}, projection))
+        _inflight_user_lookups[key] = lookup
+        lookup.add_done_callback(lambda _: _inflight_user_lookups.pop(key, None))
+    # Shielded so one caller being cancelled doesn't cancel the lookup for the others
+    user = await asyncio.shield(lookup)
+    if user:
+        logger.debug("User found with email: %s", email)
+    else:
+        _missing_user_cache[email] = True
+    return user
 
 OTP_EXPIRE_MINUTES = 10  # OTP validity
 
-async def generate_otp() -> str:
-    otp = str(random.randint(100000, 999999))  # 6-digit OTP
-    logger.info(f"OTP generated: {otp}")
-    return otp
+def generate_otp() -> str:
+    # 6-digit OTP from the OS CSPRNG; never logged
+    return str(secrets.randbelow(900000) + 100000)
 
 def otp_expiry_time() -> datetime:
-    return datetime.utcnow() + timedelta(minutes=OTP_EXPIRE_MINUTES)
+    return datetime.now(timezone.utc) + timedelta(minutes=OTP_EXPIRE_MINUTES)
+
+def otp_digest(otp: str) -> str:
+    """Keyed hash of an OTP; only the digest is stored, so a DB dump doesn't expose live OTPs."""
+    return hmac.new(SECRET_KEY.encode(), otp.encode(), hashlib.sha256).hexdigest()
+
+def _send_smtp(msg: MIMEText) -> None:
+    with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
+        server.starttls()
+        server.login(EMAIL_USER, EMAIL_PASS)
+        server.send_message(msg)
+
 
 async def send_otp_email(to_email: str, otp: str) -> bool:
     try:
@@ -130,25 +237,40 @@ async def send_otp_email(to_email: str, otp: str) -> bool:
         msg['From'] = EMAIL_USER
         msg['To'] = to_email
 
-        with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_USER, EMAIL_PASS)
-            server.send_message(msg)
+        # smtplib blocks for the TLS handshake and SMTP exchange; keep it off the event loop
+        await asyncio.to_thread(_send_smtp, msg)
 
-        logger.info(f"OTP email sent to {to_email}")
+        logger.info("OTP email sent to %s", to_email)
         return True
     except Exception as e:
-        logger.error(f"Error sending OTP email to {to_email}: {e}")
+        logger.error("Error sending OTP email to %s: %s", to_email, e)
         return False
     
 
 
-async def cleanup_expired_otps():
-    result = await password_resets_collection.delete_many({
-        "expires_at": {"$lt": datetime.utcnow()}
-    })
-    if result.deleted_count > 0:
-        logger.info(f"[OTP CLEANUP] Deleted {result.deleted_count} expired OTP records")
+# -------------------------
+# Decoded token cache
+# -------------------------
+TOKEN_CACHE_TTL_SECONDS = 60
+
+# Decoded JWT claims keyed by token hash, so repeat requests with the same
+# bearer token skip the signature check. Entries still honour the token's exp.
+_token_cache = TTLCache(maxsize=4096, ttl=TOKEN_CACHE_TTL_SECONDS)
+
+# Tokens that just failed to decode, so a replayed bad/expired token is rejected
+# without re-running the signature check for a few seconds
+TOKEN_FAILURE_TTL_SECONDS = 5
+_token_failure_cache = TTLCache(maxsize=4096, ttl=TOKEN_FAILURE_TTL_SECONDS)
+
+
+def _token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def evict_cached_token(token: str) -> None:
+    """Drop a token's cached claims (e.g. on logout)."""
+    _token_cache.pop(_token_cache_key(token), None)
+
 
 async def get_current_user(authorization: str = Header(...)):
     """
@@ -159,9 +281,39 @@ async def get_current_user(authorization: str = Header(...)):
         raise HTTPException(status_code=401, detail="Invalid Authorization header")
     
     token = authorization.split(" ")[1]
+    key = _token_cache_key(token)
+    claims = _token_cache.get(key)
+    if claims is not None and claims["exp"] > time.time():
+        return claims
+    if key in _token_failure_cache:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+
     payload = decode_jwt_token(token)
     
-    if not payload.get("success"):
+    # Tokens issued before email was added to the claims can't be scoped; make them log in again
+    if not payload.get("success") or "email" not in payload["data"]:
+        _token_cache.pop(key, None)
+        _token_failure_cache[key] = True
         raise HTTPException(status_code=401, detail="Invalid or expired token")
     
-    return payload["data"]  # contains user_id and role
+    _token_cache[key] = payload["data"]
+    return payload["data"]  # contains user_id, role and email
+
+
+def require_roles(*roles: str, detail: str = "Not authorized"):
+    """
+    Build a dependency that returns the current user only if their role is one of `roles`.
+    FastAPI resolves it before validating the request body, so a 403 skips payload parsing.
+    """
+    allowed = frozenset(roles)
+
+    async def _require_roles(request: Request, current_user: dict = Depends(get_current_user)):
+        if current_user["role"] not in allowed:
+            logger.warning(
+                "Unauthorized %s %s by %s (role=%s)",
+                request.method, request.url.path, current_user.get("email"), current_user["role"]
+            )
+            raise HTTPException(status_code=403, detail=detail)
+        return current_user
+
+    return _require_roles
@@ -0,0 +1,37 @@
+from functools import lru_cache
+from typing import Any, Dict, List
+from bson import ObjectId
+from fastapi import status
+from fastapi.responses import ORJSONResponse
+from app.schemas.common_schema import OBJECT_ID_RE
+
+# Helpers shared by the task and project services and routes
+
+_OID_RE = OBJECT_ID_RE.match
+
+@lru_cache(maxsize=4096)
+def _oid_cached(id_str: str) -> ObjectId:
+    return ObjectId(id_str)
+
+def to_object_id(id_str: str) -> ObjectId:
+    # Reject malformed ids up front instead of letting ObjectId raise; hot ids
+    # (the same task/project polled repeatedly) skip the hex parse via the cache
+    if not isinstance(id_str, str) or not _OID_RE(id_str):
+        raise ValueError("Invalid id")
+    return _oid_cached(id_str)
+
+def serialize_task(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # create_task writes every TaskOut field (None/[] when unset), so only the id needs renaming
+    if not doc:
+        return None
+    doc["id"] = str(doc.pop("_id"))
+    return doc
+
+def task_response(task: dict, status_code: int = status.HTTP_200_OK) -> ORJSONResponse:
+    # Trust boundary: task comes from our own collection via serialize_task, so it is
+    # rendered as-is; the route's response_model/responses only document the schema
+    return ORJSONResponse(task, status_code=status_code)
+
+def task_list_response(tasks: List[dict]) -> ORJSONResponse:
+    # Same trust boundary as task_response; the page is fetched before this is built
+    return ORJSONResponse(tasks)
@@ -1,7 +1,22 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from app.config import MONGO_URL, DB_NAME
+from pymongo import AsyncMongoClient
+from pymongo.collation import Collation
+from app.config import (
+    DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_URL, MONGO_WAIT_QUEUE_TIMEOUT_MS,
+)
 
-client = AsyncIOMotorClient(MONGO_URL)
+# PyMongo's native asyncio client (no Motor thread-pool hop per operation).
+# tz_aware so datetimes read back are UTC-aware, like the ones the services write.
+# One client per process; the pool is sized explicitly and a saturated pool or an unreachable
+# server fails the request within seconds instead of queueing behind it indefinitely
+client = AsyncMongoClient(
+    MONGO_URL,
+    tz_aware=True,
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+)
 db = client[DB_NAME]
 
 users_collection = db["users"]
@@ -9,3 +24,32 @@ login_attempts_collection   = db["login_attempts"]
 password_resets_collection = db["password_resets"]
 projects_collection = db["projects"]
 task_collection = db["tasks"]
+
+
+async def create_indexes():
+    """
+    Create the indexes the services rely on for their query filters and uniqueness rules.
+    create_index is a no-op when the index already exists, so this is safe on every startup.
+    """
+    # Task list filters (get_all_tasks / get_my_tasks). Lists are paged newest-first on _id,
+    # so each filter field is paired with _id to serve the sort from the index, no in-memory SORT
+    for field in ("assigned_to_dev", "assigned_to_tester", "project_id", "created_by"):
+        await task_collection.create_index([(field, 1), ("_id", -1)])
+
+    # get_user_by_email (login/register/change-password); one account per email
+    await users_collection.create_index("email", unique=True)
+
+    # OTP lookup in validate_password_reset_otp
+    await password_resets_collection.create_index("user_id")
+    # Mongo's TTL monitor deletes OTP records once expires_at has passed
+    await password_resets_collection.create_index("expires_at", expireAfterSeconds=0)
+
+    # /logout token lookup; only active sessions carry expired=False
+    await login_attempts_collection.create_index(
+        [("token", 1), ("expired", 1)], partialFilterExpression={"expired": False}
+    )
+
+    # Project names are unique case-insensitively (strength 2 ignores case)
+    await projects_collection.create_index(
+        "name", unique=True, collation=Collation(locale="en", strength=2)
+    )
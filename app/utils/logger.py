@@ -1,6 +1,9 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import os
+import queue
+from app.config import LOG_LEVEL
 
 # Create logs directory if not exists
 LOG_DIR = "logs"
@@ -17,8 +20,15 @@ formatter = logging.Formatter(log_format)
 file_handler = RotatingFileHandler(LOG_FILE, maxBytes=5*1024*1024,backupCount=5)
 file_handler.setFormatter(formatter)
 
-# Get the logger
-logger = logging.getLogger("user_registration")
-logger.setLevel(logging.INFO)
-logger.addHandler(file_handler)
+# The QueueHandler still formats each record on the calling thread (the event loop);
+# the listener thread does the file writes and rotation. Stopped at exit so queued
+# records are flushed
+log_queue = queue.Queue(-1)
+queue_listener = QueueListener(log_queue, file_handler)
+queue_listener.start()
+atexit.register(queue_listener.stop)
 
+# Get the logger (LOG_LEVEL=WARNING in production keeps per-request INFO lines out)
+logger = logging.getLogger("user_registration")
+logger.setLevel(LOG_LEVEL)
+logger.addHandler(QueueHandler(log_queue))
@@ -1,15 +1,30 @@
+from contextlib import asynccontextmanager
 from app.utils.logger import logger
+from app.utils.db_utils import create_indexes
+from app.utils.audit_utils import start_audit_writer, stop_audit_writer
 from app.routes import task_routes, user_routes,project_routes
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await create_indexes()
+    start_audit_writer()
+    yield
+    await stop_audit_writer()
 
 app = FastAPI(
     title = "Role Based Task Assignment and Tracking System",
-    version = "1.0.0"
+    version = "1.0.0",
+    default_response_class = ORJSONResponse,
+    lifespan = lifespan
 )
 
+# Polled constantly: async so it stays on the event loop instead of the threadpool, and
+# logged at debug so the pollers don't fill the log file
 @app.get("/health-check")
-def health_check():
-    logger.info("Application started successfully")
+async def health_check():
+    logger.debug("Health check")
     return {"Status": "Healthy"}
 
 app.include_router(user_routes.router, prefix="/users")